@@ -0,0 +1,64 @@
+'''
+@Created Date 19 Oct 2026
+@Copyright (c) 2022, AUTIMATIC
+
+Compare the XML parser backends on CVAT XML dumps
+'''
+
+import argparse
+import io
+import time
+
+from contextlib import redirect_stdout
+
+from cvatxml2coco import convert_root
+from xmlbackend import available_backends, get_backend
+
+def benchmark(cvat_xmls, with_personkeypoints, with_dummyobject_activity, repeat):
+    print("%-30s %-6s %10s %10s %12s" % ("file", "parser", "parse (s)", "meta (s)", "convert (s)"))
+    for cvat_xml in cvat_xmls:
+        for name in available_backends():
+            backend = get_backend(name)
+            parse_times, meta_times, convert_times = [], [], []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                root = backend.parse(cvat_xml)
+                parse_times.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                for _ in backend.iterparse(cvat_xml, "meta"):
+                    break
+                meta_times.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                # the progress output of the converter is not measured
+                with redirect_stdout(io.StringIO()):
+                    convert_root(root, with_personkeypoints, with_dummyobject_activity)
+                convert_times.append(time.perf_counter() - start)
+            # best of the runs, the least disturbed by other processes
+            print("%-30s %-6s %10.3f %10.3f %12.3f" % (cvat_xml, name, min(parse_times), min(meta_times), min(convert_times)))
+
+def parse_args():
+    """Parse arguments of command line"""
+    parser = argparse.ArgumentParser(
+        description='Benchmark the XML parser backends on CVAT XML files'
+    )
+    parser.add_argument(
+        '--cvat-xml', metavar='FILE', required=True, nargs='+',
+        help='Input files with CVAT annotations in XML format'
+    )
+    parser.add_argument("--with-personkeypoints", default=False, action='store_true',
+                    help="Use this flag when person key points are included")
+    parser.add_argument("--with-dummyobject-activity", default=False, action="store_true",
+                    help="Flag to use dummy object activity")
+    parser.add_argument("--repeat", type=int, default=3,
+                    help="Number of runs per backend, the best run is reported")
+
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    benchmark(args.cvat_xml, args.with_personkeypoints, args.with_dummyobject_activity, args.repeat)
+
+if __name__ == '__main__':
+    main()
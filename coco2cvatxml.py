@@ -12,9 +12,13 @@ from xml.sax.saxutils import XMLGenerator
 
 import numpy as np
 import argparse
-import json
+
+from cocoio import is_ndjson, load_coco_json, stream_coco_json
+from pipeline import open_file
 
 KEY_POINTS_PERSON_LABELS = [ "nose", "left_eye", "right_eye", "left_ear", "right_ear", "left_shoulder", "right_shoulder", "left_elbow", "right_elbow", "left_wrist", "right_wrist", "left_hip", "right_hip", "left_knee", "right_knee", "left_ankle", "right_ankle" ]
+# CVAT skeleton label holding all person key points of a frame
+KEY_POINTS_SKELETON_LABEL = "person_skeleton"
 
 class XmlAnnotationWriter:
     def __init__(self, file):
@@ -95,6 +99,11 @@ class XmlAnnotationWriter:
         self.xmlgen.startElement("points", points)
         self._level += 1
 
+    def open_skeleton(self, skeleton):
+        self._indent()
+        self.xmlgen.startElement("skeleton", skeleton)
+        self._level += 1
+
     def open_tag(self, tag):
         self._indent()
         self.xmlgen.startElement("tag", tag)
@@ -121,6 +130,11 @@ class XmlAnnotationWriter:
         self._indent()
         self.xmlgen.endElement("points")
 
+    def close_skeleton(self):
+        self._level -= 1
+        self._indent()
+        self.xmlgen.endElement("skeleton")
+
     def close_tag(self):
         self._level -= 1
         self._indent()
@@ -151,12 +165,15 @@ def fourwise(iterable):
     return zip(a, a, a, a)
 
 
-def convert(coco_json_file, cvat_xml, with_personkeypoints, with_dummyobject_activity):
+def convert(coco_json_file, cvat_xml, with_personkeypoints, with_dummyobject_activity, with_skeleton=False, image_mode=False, pipelined=False):
+    if image_mode:
+        _convert_image_mode(coco_json_file, cvat_xml, with_personkeypoints, with_dummyobject_activity, with_skeleton, pipelined)
+        return
     # Opening the JSON file
     print(f"Opening the JSON file {coco_json_file}")
-    json_f = open(coco_json_file)
     track_ids_to_convert = []
-    json_data = json.load(json_f)
+    json_data = load_coco_json(coco_json_file, pipelined)
+    _check_problems(coco_json_file, *validate_annotations(json_data["annotations"], json_data.get("categories"), json_data.get("images"), with_personkeypoints))
     last_frame_id = 0
     for data in json_data["annotations"]:
         if "track_id" in data:
@@ -188,7 +205,7 @@ def convert(coco_json_file, cvat_xml, with_personkeypoints, with_dummyobject_act
     print("track_ids_to_convert, %s!" % track_ids_to_convert)
 
     # Write the xml file
-    with open(cvat_xml, 'w') as f:
+    with open_file(cvat_xml, 'w', pipelined) as f:
         dumper = XmlAnnotationWriter(f)
         dumper.open_root()
 
@@ -261,8 +278,13 @@ def convert(coco_json_file, cvat_xml, with_personkeypoints, with_dummyobject_act
                 # Add 1 to track for next object to convert
                 cvat_track_id += 1
 
+            # Convert person key points to one XML skeleton track
+            if(category == "person" and with_personkeypoints and with_skeleton):
+                _create_skeleton_track_func(dumper, json_data, cvat_track_id, track_id_to_convert, max_frame_id, last_frame_id)
+                # Add 1 to track for next object to convert
+                cvat_track_id += 1
             # Convert person key points to XML
-            if(category == "person" and with_personkeypoints):
+            elif(category == "person" and with_personkeypoints):
                 # Iterate over all person key points
                 for person_key_point_idx in range(len(KEY_POINTS_PERSON_LABELS)):
                     # Create a track for each key point in the XML
@@ -286,7 +308,6 @@ def convert(coco_json_file, cvat_xml, with_personkeypoints, with_dummyobject_act
                         elif "image_id" in data:
                             frame_id = data["image_id"] - 1
                         index = 0
-                        assert len(data["keypoints"]) != 0, "Error length keypoints %s" %len(data["keypoints"])
                         arr_keypoints = np.reshape(data["keypoints"], (17, 3))
                         for keypoint in arr_keypoints:
                              # x and y indicate pixel positions in the image. z indicates visibility
@@ -314,12 +335,218 @@ def convert(coco_json_file, cvat_xml, with_personkeypoints, with_dummyobject_act
                             index += 1
                     dumper.close_track()
                     person_key_point_idx += 1
-        # Closing file
-        print(f"Closing the JSON file {coco_json_file}")
-        json_f.close()
         dumper.close_root()
         print(f"Wrote file {cvat_xml}")
 
+def _convert_image_mode(coco_json_file, cvat_xml, with_personkeypoints, with_dummyobject_activity, with_skeleton, pipelined=False):
+    # One pass over frame ordered annotations, an <image> block is written as soon as the frame changes
+    print(f"Opening the JSON file {coco_json_file}")
+    header, annotations = stream_coco_json(coco_json_file, pipelined)
+    if is_ndjson(coco_json_file):
+        # validate in a first pass over the lines, convert in a second pass
+        problems, warnings = validate_frame_ordered(annotations, header.get("categories"), header.get("images"), with_personkeypoints)
+        header, annotations = stream_coco_json(coco_json_file, pipelined)
+    else:
+        annotations = list(annotations)
+        problems, warnings = validate_frame_ordered(annotations, header.get("categories"), header.get("images"), with_personkeypoints)
+    _check_problems(coco_json_file, problems, warnings)
+    cat_name2id = {}
+    for data in header.get("categories", []):
+        cat_name2id[data["id"]] = data["name"]
+    # if empy set default categories
+    if len(cat_name2id) == 0:
+        cat_name2id[1] = "person"
+    print("Categories, %s!" % cat_name2id)
+
+    with open_file(cvat_xml, 'w', pipelined) as f:
+        dumper = XmlAnnotationWriter(f)
+        dumper.open_root()
+        current_frame_id = None
+        for data in annotations:
+            if "track_id" in data:
+                json_track_id = data["track_id"]
+            elif "attributes" in data and "track_id" in data["attributes"]:
+                json_track_id = data["attributes"]["track_id"]
+            if "frame_id" in data:
+                frame_id = data["frame_id"]
+            elif "image_id" in data:
+                frame_id = data["image_id"] - 1
+            if frame_id != current_frame_id:
+                if current_frame_id is not None:
+                    dumper.close_image()
+                dumper.open_image(OrderedDict([("id", str(frame_id)), ("name", "frame_{:06d}".format(frame_id))]))
+                current_frame_id = frame_id
+            category = cat_name2id.get(data["category_id"])
+            group_id = str(json_track_id + 1)
+            _create_image_shapes(dumper, data, category, group_id, json_track_id, with_personkeypoints, with_dummyobject_activity, with_skeleton)
+        if current_frame_id is not None:
+            dumper.close_image()
+        dumper.close_root()
+        print(f"Wrote file {cvat_xml}")
+
+def _create_image_shapes(dumper, data, category, group_id, json_track_id, with_personkeypoints, with_dummyobject_activity, with_skeleton):
+    box = data["bbox"]
+    shape = OrderedDict([
+        ("label", category),
+        ("occluded", str(data.get("occluded", 0))),
+        ("xtl", "{:.2f}".format(box[0])),
+        ("ytl", "{:.2f}".format(box[1])),
+        ("xbr", "{:.2f}".format(box[0]+box[2])),
+        ("ybr", "{:.2f}".format(box[1]+box[3])),
+        ("z_order", str(0)),
+        ("group_id", group_id)
+    ])
+    dumper.open_box(shape)
+    activity = None
+    if "activity" in data:
+        activity = data["activity"]
+    if "attributes" in data and "activity" in data["attributes"]:
+        activity = data["attributes"]["activity"]
+    if(with_dummyobject_activity and category == "person"):
+        dumper.add_attribute(OrderedDict([("name", "orig_track_id"),("value", str(json_track_id))]))
+    if(not with_dummyobject_activity and category == "person"):
+        if activity is not None and len(activity) > 0 :
+            dumper.add_attribute(OrderedDict([("name", "activity"),("value", activity[0])]))
+        else:
+            dumper.add_attribute(OrderedDict([("name", "activity"),("value", "no action")]))
+    dumper.close_box()
+
+    if(with_dummyobject_activity and category == "person"):
+        shape = OrderedDict([("label", "activity"), ("occluded", str(0)), ("points", "0.00,0.00"), ("z_order", str(0)), ("group_id", group_id)])
+        dumper.open_points(shape)
+        if activity is not None and len(activity) > 0 :
+            dumper.add_attribute(OrderedDict([("name", "activity"),("value", activity[0])]))
+        else:
+            dumper.add_attribute(OrderedDict([("name", "activity"),("value", "no action")]))
+        dumper.add_attribute(OrderedDict([("name", "orig_track_id"),("value", str(json_track_id))]))
+        dumper.close_points()
+
+    if not (category == "person" and with_personkeypoints):
+        return
+    if with_skeleton:
+        dumper.open_skeleton(OrderedDict([("label", KEY_POINTS_SKELETON_LABEL), ("z_order", str(0)), ("group_id", group_id)]))
+    # x and y indicate pixel positions in the image. z indicates visibility
+    for label, (x, y, z) in zip(KEY_POINTS_PERSON_LABELS, threewise(data["keypoints"])):
+        if with_skeleton:
+            shape = OrderedDict([("label", label), ("outside", str(1) if z == 0 else str(0))])
+        elif z == 0:
+            # not labeled, image mode has no outside points
+            continue
+        else:
+            shape = OrderedDict([("label", label)])
+        shape["occluded"] = str(1) if z == 1 else str(0)
+        shape["points"] = '{:.2f},{:.2f}'.format(x, y)
+        if not with_skeleton:
+            shape["z_order"] = str(0)
+            shape["group_id"] = group_id
+        dumper.open_points(shape)
+        dumper.close_points()
+    if with_skeleton:
+        dumper.close_skeleton()
+
+def validate_annotations(annotations, categories, images, with_personkeypoints):
+    # Gather the annotations in columns once, then check all of them with array operations.
+    # Returns the problems that stop the conversion and the warnings (boxes outside the image)
+    problems = []
+    warnings = []
+    _validate_columns(list(annotations), 0, _cat_names(categories), _image_sizes(images), with_personkeypoints, problems, warnings)
+    return problems, warnings
+
+def validate_frame_ordered(annotations, categories, images, with_personkeypoints):
+    # Same checks one frame block at a time, memory does not grow with the input. With the frames in order
+    # a (track, frame) pair can only repeat inside its block, only the previous frame is carried over
+    cat_name2id = _cat_names(categories)
+    image_sizes = _image_sizes(images)
+    problems = []
+    warnings = []
+    block = []
+    block_frame_id = None
+    offset = 0
+    prev_frame_id = -np.inf
+    for data in annotations:
+        frame_id = data.get("frame_id", data["image_id"] - 1 if "image_id" in data else None)
+        if block and frame_id != block_frame_id:
+            prev_frame_id = _validate_columns(block, offset, cat_name2id, image_sizes, with_personkeypoints, problems, warnings, prev_frame_id)
+            offset += len(block)
+            block = []
+        block.append(data)
+        block_frame_id = frame_id
+    if block:
+        _validate_columns(block, offset, cat_name2id, image_sizes, with_personkeypoints, problems, warnings, prev_frame_id)
+    return problems, warnings
+
+def _cat_names(categories):
+    return {data["id"]: data["name"] for data in categories or []} or {1: "person"}
+
+def _image_sizes(images):
+    return {data["id"]: (data.get("width", np.inf), data.get("height", np.inf)) for data in images or []}
+
+def _validate_columns(annotations, offset, cat_name2id, image_sizes, with_personkeypoints, problems, warnings, prev_frame_id=None):
+    # offset: index of the first annotation in the input. With prev_frame_id the frames must not go back,
+    # returns the last frame for the next block
+    annot_ids, track_ids, frame_ids, image_ids, category_ids, bboxes, keypoint_lens = [], [], [], [], [], [], []
+    for data in annotations:
+        annot_ids.append(data.get("id", -1))
+        track_id = data.get("track_id", data.get("attributes", {}).get("track_id"))
+        track_ids.append(np.nan if track_id is None else track_id)
+        if "frame_id" in data:
+            frame_ids.append(data["frame_id"])
+        elif "image_id" in data:
+            frame_ids.append(data["image_id"] - 1)
+        else:
+            frame_ids.append(np.nan)
+        image_ids.append(data.get("image_id", -1))
+        category_ids.append(data.get("category_id", -1))
+        bbox = data.get("bbox") or []
+        bboxes.append(bbox if len(bbox) == 4 else [np.nan] * 4)
+        keypoint_lens.append(len(data.get("keypoints") or []))
+    annot_ids = np.asarray(annot_ids)
+    track_ids = np.asarray(track_ids, dtype=float)
+    frame_ids = np.asarray(frame_ids, dtype=float)
+    category_ids = np.asarray(category_ids)
+    bboxes = np.asarray(bboxes, dtype=float).reshape(-1, 4)
+    keypoint_lens = np.asarray(keypoint_lens)
+
+    def report(mask, message, found=problems):
+        for idx in np.flatnonzero(mask):
+            found.append("annotation %s (id %s, track %s, frame %s): %s" % (offset + idx, annot_ids[idx], _fmt(track_ids[idx]), _fmt(frame_ids[idx]), message))
+
+    report(np.isnan(track_ids), "missing track_id")
+    report(np.isnan(frame_ids), "missing frame_id and image_id")
+    report(~np.isin(category_ids, list(cat_name2id)), "unknown category_id")
+    report(np.isnan(bboxes).any(axis=1), "bbox is not [x, y, width, height]")
+    report((bboxes[:, 2] <= 0) | (bboxes[:, 3] <= 0), "bbox width or height not positive")
+    report((bboxes[:, 0] < 0) | (bboxes[:, 1] < 0), "bbox outside the image", warnings)
+    if image_sizes:
+        sizes = np.asarray([image_sizes.get(image_id, (np.inf, np.inf)) for image_id in image_ids], dtype=float).reshape(-1, 2)
+        report((bboxes[:, 0] + bboxes[:, 2] > sizes[:, 0]) | (bboxes[:, 1] + bboxes[:, 3] > sizes[:, 1]), "bbox outside the image", warnings)
+    if with_personkeypoints:
+        person_ids = [cat_id for cat_id, name in cat_name2id.items() if name == "person"]
+        report(np.isin(category_ids, person_ids) & (keypoint_lens != 3 * len(KEY_POINTS_PERSON_LABELS)),
+               "person keypoints are not %s values" % (3 * len(KEY_POINTS_PERSON_LABELS)))
+    # (track, frame) pairs seen before
+    known = ~np.isnan(track_ids) & ~np.isnan(frame_ids)
+    keys = np.stack([track_ids, frame_ids], axis=1)
+    _, first = np.unique(keys[known], axis=0, return_index=True)
+    duplicate = known.copy()
+    duplicate[np.flatnonzero(known)[first]] = False
+    report(duplicate, "duplicate track and frame")
+    if prev_frame_id is None:
+        return None
+    report(np.diff(frame_ids, prepend=prev_frame_id) < 0, "not ordered by frame")
+    known_frames = frame_ids[~np.isnan(frame_ids)]
+    return known_frames[-1] if len(known_frames) else prev_frame_id
+
+def _fmt(value):
+    return "?" if np.isnan(value) else int(value)
+
+def _check_problems(coco_json_file, problems, warnings):
+    # Boxes outside the image are converted as they are, the other problems stop the conversion
+    for warning in warnings:
+        print("Warning, %s" % warning)
+    if problems:
+        raise ValueError("%s problems in %s:\n%s" % (len(problems), coco_json_file, "\n".join(problems)))
+
 def _retrieve_min_and_max_frame_for_track_id(json_data, track_id_to_convert):
     max_frame_id = 0
     min_frame_id = float('inf')
@@ -360,6 +587,47 @@ def _createShapeBox(box, frame_no, last_frame_id, max_frame_id):
         shape["outside"] = str(1)
     return shape
 
+def _create_skeleton_track_func(dumper, json_data, xml_track_id, track_id_to_convert, max_frame_id, last_frame_id):
+    track = {
+        'id': str(xml_track_id),
+        'label': KEY_POINTS_SKELETON_LABEL,
+        'group_id': str(track_id_to_convert + 1)
+    }
+    dumper.open_track(track)
+    for data in json_data["annotations"]:
+        if "track_id" in data:
+            json_track_id = data["track_id"]
+        elif "attributes" in data and "track_id" in data["attributes"]:
+            json_track_id = data["attributes"]["track_id"]
+        if track_id_to_convert != json_track_id:
+            continue
+        if "frame_id" in data:
+            frame_id = data["frame_id"]
+        elif "image_id" in data:
+            frame_id = data["image_id"] - 1
+        skeleton = OrderedDict()
+        skeleton["frame"] = str(frame_id)
+        skeleton["keyframe"] = str(1)
+        skeleton["outside"] = str(0)
+        # if last skeleton from sequence
+        if frame_id == max_frame_id and last_frame_id != max_frame_id:
+            skeleton["outside"] = str(1)
+        skeleton["occluded"] = str(0)
+        skeleton["z_order"] = str(0)
+        dumper.open_skeleton(skeleton)
+        # One element per key point, x and y indicate pixel positions in the image. z indicates visibility
+        for label, (x, y, z) in zip(KEY_POINTS_PERSON_LABELS, threewise(data["keypoints"])):
+            shape = OrderedDict()
+            shape["label"] = label
+            shape["keyframe"] = str(1)
+            shape["outside"] = str(1) if z == 0 else str(0)
+            shape["occluded"] = str(1) if z == 1 else str(0)
+            shape["points"] = '{:.2f},{:.2f}'.format(x, y)
+            dumper.open_points(shape)
+            dumper.close_points()
+        dumper.close_skeleton()
+    dumper.close_track()
+
 def _create_dummy_object_func(action, dumper, json_data, xml_track_id, track_id_to_convert, min_frame_id, max_frame_id, last_frame_id):
     dummy_track = {
         'id': str(xml_track_id),
@@ -424,13 +692,19 @@ def parse_args():
                     help="Use this flag when person key points are included")
     parser.add_argument("--with-dummyobject-activity", default=False, action='store_true',
                     help="Flag to create dummy object activity")
+    parser.add_argument("--with-skeleton", default=False, action='store_true',
+                    help="Write the person key points as one CVAT skeleton track instead of a track per key point")
+    parser.add_argument("--image-mode", default=False, action='store_true',
+                    help="Write <image> blocks per frame in one pass, the annotations must be ordered by frame")
+    parser.add_argument("--pipelined", default=False, action='store_true',
+                    help="Read and write the files in background threads, overlapping I/O with the conversion")
 
     return parser.parse_args()
 
 
 def main():
     args = parse_args()
-    convert(args.coco_json, args.cvat_xml, args.with_personkeypoints, args.with_dummyobject_activity)
+    convert(args.coco_json, args.cvat_xml, args.with_personkeypoints, args.with_dummyobject_activity, args.with_skeleton, args.image_mode, args.pipelined)
 
 
 if __name__ == '__main__':
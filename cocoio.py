@@ -0,0 +1,275 @@
+'''
+@Created Date 19 Oct 2026
+@Copyright (c) 2022, AUTIMATIC
+
+Read and write COCO JSON annotations in the supported output formats
+'''
+
+import json
+import os
+
+import numpy as np
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from pipeline import open_file
+
+# json: indented document, compact: document without whitespace,
+# ndjson: one annotation per line plus a header file with info and categories
+OUTPUT_FORMATS = ["json", "compact", "ndjson"]
+# frames: shards hold consecutive frames, track: shards hold whole tracks
+SHARD_BY = ["frames", "track"]
+
+def header_path(json_path):
+    # out.ndjson -> out.ndjson.header.json
+    path = Path(json_path)
+    return path.with_name(f"{path.name}.header.json")
+
+def is_ndjson(json_path, sniff_size=1 << 16):
+    if Path(json_path).suffix == ".ndjson":
+        return True
+    # By content: the first line of NDJSON is a complete annotation, a JSON document
+    # starts with "{" alone (indented) or is one long line holding the annotations (compact)
+    with open(json_path, "rb") as f:
+        chunk = f.read(sniff_size)
+    first_line, newline, _ = chunk.lstrip().partition(b"\n")
+    if not newline:
+        return False
+    try:
+        first = json.loads(first_line)
+    except ValueError:
+        return False
+    return isinstance(first, dict) and "annotations" not in first
+
+def write_coco_json(json_path, coco_dict, output_format="json", pipelined=False):
+    if output_format == "ndjson":
+        _write_ndjson(json_path, coco_dict, pipelined)
+    else:
+        with open_file(json_path, "w", pipelined) as f:
+            if output_format == "compact":
+                json.dump(coco_dict, f, separators=(",", ":"))
+            else:
+                json.dump(coco_dict, f, indent=2)
+    print(f"Wrote json to {json_path}")
+
+def _write_ndjson(json_path, coco_dict, pipelined=False):
+    header = {k: v for k, v in coco_dict.items() if k != "annotations"}
+    with open(header_path(json_path), "w") as f:
+        json.dump(header, f, separators=(",", ":"))
+    with open_file(json_path, "w", pipelined) as f:
+        for annot_dict in coco_dict["annotations"]:
+            f.write(json.dumps(annot_dict, separators=(",", ":")))
+            f.write("\n")
+
+class CocoStreamWriter:
+    # Writes the header first and then one annotation at a time, the output is the same as write_coco_json.
+    # The annotations go to a temporary file that replaces json_path on close, discard() removes it
+    def __init__(self, json_path, header, output_format="json", pipelined=False):
+        self.json_path = json_path
+        self.output_format = output_format
+        self._header = header
+        self._count = 0
+        self._tmp_path = Path(f"{json_path}.tmp")
+        self.file = open_file(self._tmp_path, "w", pipelined)
+        if output_format == "compact":
+            self.file.write("{")
+            for k, v in header.items():
+                self.file.write(f"{json.dumps(k)}:{json.dumps(v, separators=(',', ':'))},")
+            self.file.write('"annotations":[')
+        elif output_format != "ndjson":
+            self.file.write("{")
+            for k, v in header.items():
+                self.file.write(f"\n  {json.dumps(k)}: {self._indent(json.dumps(v, indent=2), 1)},")
+            self.file.write('\n  "annotations": [')
+
+    def _indent(self, text, level):
+        return text.replace("\n", "\n" + "  " * level)
+
+    def add_annotation(self, annot_dict):
+        if self.output_format == "ndjson":
+            self.file.write(json.dumps(annot_dict, separators=(",", ":")))
+            self.file.write("\n")
+        elif self.output_format == "compact":
+            if self._count:
+                self.file.write(",")
+            self.file.write(json.dumps(annot_dict, separators=(",", ":")))
+        else:
+            if self._count:
+                self.file.write(",")
+            self.file.write("\n    " + self._indent(json.dumps(annot_dict, indent=2), 2))
+        self._count += 1
+
+    def close(self):
+        if self.output_format == "compact":
+            self.file.write("]}")
+        elif self.output_format != "ndjson":
+            self.file.write("\n  ]\n}" if self._count else "]\n}")
+        self.file.close()
+        if self.output_format == "ndjson":
+            with open(header_path(self.json_path), "w") as f:
+                json.dump(self._header, f, separators=(",", ":"))
+        os.replace(self._tmp_path, self.json_path)
+        print(f"Wrote json to {self.json_path}")
+
+    def discard(self):
+        try:
+            self.file.close()
+        finally:
+            self._tmp_path.unlink(missing_ok=True)
+
+def write_coco_shards(manifest_path, coco_dict, shard_size, shard_by="frames", output_format="json", workers=4, pipelined=False):
+    # The manifest lists each shard with its frame span, track ids and number of annotations
+    manifest_path = Path(manifest_path)
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    suffix = ".ndjson" if output_format == "ndjson" else ".json"
+    header = {k: v for k, v in coco_dict.items() if k != "annotations"}
+    if shard_by == "track":
+        shards = _shard_by_track(coco_dict["annotations"], shard_size)
+    else:
+        shards = _shard_by_frames(coco_dict["annotations"], shard_size)
+
+    manifest = OrderedDict(header)
+    manifest["shard_by"] = shard_by
+    manifest["shards"] = []
+    jobs = []
+    for shard_idx, annotations in enumerate(shards):
+        shard_path = manifest_path.with_name(f"{manifest_path.stem}-{shard_idx:05d}{suffix}")
+        frame_ids = [annot_dict["frame_id"] for annot_dict in annotations]
+        track_ids = sorted({annot_dict["track_id"] for annot_dict in annotations})
+        manifest["shards"].append({
+            "file": shard_path.name,
+            "frame_start": min(frame_ids),
+            "frame_stop": max(frame_ids),
+            "track_ids": track_ids,
+            "num_annotations": len(annotations)
+        })
+        shard_dict = dict(header)
+        shard_dict["annotations"] = annotations
+        jobs.append((shard_path, shard_dict))
+
+    # Shards are independent files, the JSON encoding holds the GIL so they are written in worker processes
+    if workers <= 1 or len(jobs) <= 1:
+        for shard_path, shard_dict in jobs:
+            write_coco_json(shard_path, shard_dict, output_format, pipelined)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            futures = [executor.submit(write_coco_json, shard_path, shard_dict, output_format, pipelined) for shard_path, shard_dict in jobs]
+            for future in futures:
+                future.result()
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Wrote manifest of {len(jobs)} shards to {manifest_path}")
+
+def _shard_by_frames(annotations, shard_size):
+    # A frame is never split over two shards, so a shard can exceed shard_size when a single frame does
+    by_frame = OrderedDict()
+    for annot_dict in sorted(annotations, key=lambda a: (a["frame_id"], a["track_id"])):
+        by_frame.setdefault(annot_dict["frame_id"], []).append(annot_dict)
+    return _pack(by_frame.values(), shard_size)
+
+def _shard_by_track(annotations, shard_size):
+    # A track is never split over two shards, so a shard can exceed shard_size when a single track does
+    by_track = OrderedDict()
+    for annot_dict in sorted(annotations, key=lambda a: (a["track_id"], a["frame_id"])):
+        by_track.setdefault(annot_dict["track_id"], []).append(annot_dict)
+    return _pack(by_track.values(), shard_size)
+
+def _pack(groups, shard_size):
+    shards = []
+    shard = []
+    for group in groups:
+        if shard and len(shard) + len(group) > shard_size:
+            shards.append(shard)
+            shard = []
+        shard.extend(group)
+    if shard:
+        shards.append(shard)
+    return shards
+
+def write_coco_npy(npy_dir, coco_dict):
+    # Dense person arrays indexed by [track row, frame - frame_start], readable with np.load(..., mmap_mode="r")
+    npy_dir = Path(npy_dir)
+    npy_dir.mkdir(parents=True, exist_ok=True)
+    person_ids = [cat_dict["id"] for cat_dict in coco_dict["categories"] if cat_dict["name"] == "person"]
+    keypoint_labels = next((cat_dict.get("keypoints", []) for cat_dict in coco_dict["categories"] if cat_dict["name"] == "person"), [])
+    annotations = [annot_dict for annot_dict in coco_dict["annotations"] if annot_dict["category_id"] in person_ids]
+    track_ids = sorted({annot_dict["track_id"] for annot_dict in annotations})
+    activities = sorted({action for annot_dict in annotations for action in annot_dict.get("activity", [])})
+    frame_ids = [annot_dict["frame_id"] for annot_dict in annotations]
+    frame_start = min(frame_ids, default=0)
+    frame_stop = max(frame_ids, default=-1)
+    num_tracks = len(track_ids)
+    num_frames = frame_stop - frame_start + 1
+
+    keypoints = np.lib.format.open_memmap(npy_dir / "keypoints.npy", mode="w+", dtype=np.float32,
+                                          shape=(num_tracks, num_frames, len(keypoint_labels), 3))
+    bbox = np.lib.format.open_memmap(npy_dir / "bbox.npy", mode="w+", dtype=np.float32, shape=(num_tracks, num_frames, 4))
+    activity = np.lib.format.open_memmap(npy_dir / "activity.npy", mode="w+", dtype=np.bool_, shape=(num_tracks, num_frames, len(activities)))
+    valid = np.lib.format.open_memmap(npy_dir / "valid.npy", mode="w+", dtype=np.bool_, shape=(num_tracks, num_frames))
+
+    track_rows = {track_id: row for row, track_id in enumerate(track_ids)}
+    activity_cols = {action: col for col, action in enumerate(activities)}
+    for annot_dict in annotations:
+        row = track_rows[annot_dict["track_id"]]
+        col = annot_dict["frame_id"] - frame_start
+        if annot_dict.get("keypoints"):
+            keypoints[row, col] = np.reshape(annot_dict["keypoints"], (len(keypoint_labels), 3))
+        bbox[row, col] = annot_dict["bbox"]
+        for action in annot_dict.get("activity", []):
+            activity[row, col, activity_cols[action]] = True
+        valid[row, col] = True
+    for array in (keypoints, bbox, activity, valid):
+        array.flush()
+
+    index = {
+        "track_ids": track_ids,
+        "frame_start": frame_start,
+        "frame_stop": frame_stop,
+        "keypoints": keypoint_labels,
+        "activities": activities,
+        "arrays": {
+            "keypoints.npy": "[track, frame, keypoint, (x, y, visibility)]",
+            "bbox.npy": "[track, frame, (x, y, width, height)]",
+            "activity.npy": "[track, frame, activity]",
+            "valid.npy": "[track, frame]"
+        }
+    }
+    with open(npy_dir / "index.json", "w") as f:
+        json.dump(index, f, indent=2)
+    print(f"Wrote {num_tracks} tracks x {num_frames} frames to {npy_dir}")
+
+def load_coco_json(json_path, pipelined=False):
+    header, annotations = stream_coco_json(json_path, pipelined)
+    coco_dict = dict(header)
+    coco_dict["annotations"] = list(annotations)
+    return coco_dict
+
+def stream_coco_json(json_path, pipelined=False):
+    # Header and an iterator over the annotations, NDJSON annotations are read line by line
+    if not is_ndjson(json_path):
+        with open_file(json_path, "r", pipelined) as f:
+            coco_dict = json.load(f)
+        annotations = coco_dict.pop("annotations", [])
+        return coco_dict, iter(annotations)
+    return load_coco_header(json_path), iter_coco_annotations(json_path, pipelined)
+
+def load_coco_header(json_path):
+    # Info and categories without the annotations
+    path = header_path(json_path)
+    if not path.exists():
+        return {"info": {}, "categories": []}
+    with open(path) as f:
+        return json.load(f)
+
+def iter_coco_annotations(json_path, pipelined=False):
+    # NDJSON is read line by line, a JSON document has to be loaded in full
+    if not is_ndjson(json_path):
+        with open_file(json_path, "r", pipelined) as f:
+            yield from json.load(f)["annotations"]
+        return
+    with open_file(json_path, "r", pipelined) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
@@ -6,35 +6,48 @@
 Convert person skeletons from CVAT XML to COCO JSON
 '''
 
-import xml.etree.ElementTree as ET
-import json
 import argparse
 
+import numpy as np
+
 from datetime import datetime, date
 from pathlib import Path
 
+from cocoio import OUTPUT_FORMATS, SHARD_BY, write_coco_json, write_coco_npy, write_coco_shards
+from pipeline import open_file
+from xmlbackend import XML_BACKENDS, get_backend
+
 # personkeypoints
 KEY_POINTS_PERSON_LABELS = [ "nose", "left_eye", "right_eye", "left_ear", "right_ear", "left_shoulder", "right_shoulder", "left_elbow", "right_elbow", "left_wrist", "right_wrist", "left_hip", "right_hip", "left_knee", "right_knee", "left_ankle", "right_ankle" ]
 KEY_POINTS_FACE_LABELS = [ "nose", "left_eye", "right_eye", "left_ear", "right_ear"]
+# CVAT skeleton label holding all person key points of a frame
+KEY_POINTS_SKELETON_LABEL = "person_skeleton"
 
-def _write_json(json_path, dic):
-    with open(json_path, "w") as f:
-        json.dump(dic, f, indent=2)
-    print(f"Wrote json to {json_path}")
+def convert(cvat_xml, coco_json_file, with_personkeypoints, with_dummyobject_activity, output_format="json",
+            shard_size=0, shard_by="frames", shard_workers=4, pipelined=False, npy_dir=None, xml_backend="etree"):
+    # Parse XML
+    backend = get_backend(xml_backend)
+    print(f"Parse XML {cvat_xml} with {backend.name}")
+    with open_file(cvat_xml, "rb", pipelined) as f:
+        root = backend.parse(f)
 
+    coco_dict = convert_root(root, with_personkeypoints, with_dummyobject_activity)
 
-def convert(cvat_xml, coco_json_file, with_personkeypoints, with_dummyobject_activity):
-    # Parse XML
-    print(f"Parse XML {cvat_xml}")
-    tree = ET.parse(cvat_xml)
-    root = tree.getroot()
+    if not coco_json_file:
+        coco_json_file = f"{coco_dict['info']['description']}.json"
+    if shard_size > 0:
+        write_coco_shards(coco_json_file, coco_dict, shard_size, shard_by, output_format, shard_workers, pipelined)
+    else:
+        write_coco_json(coco_json_file, coco_dict, output_format, pipelined)
+    if npy_dir:
+        write_coco_npy(npy_dir, coco_dict)
 
+def parse_meta(meta):
     # META info
     taskname = "project"
     date_str = f"{date.today():%Y/%m/%d}"
     start_frame = 0
     stop_frame = 0
-    meta = root.find("meta")
     if meta is not None:
         task = meta.find("task")
         if task is None:
@@ -52,9 +65,19 @@ def convert(cvat_xml, coco_json_file, with_personkeypoints, with_dummyobject_act
             stop_frame_el = task.find("stop_frame")
             start_frame = int(start_frame_el.text)
             stop_frame = int(stop_frame_el.text)
+    return taskname, date_str, start_frame, stop_frame
 
-    if not coco_json_file:
-        coco_json_file = f"{taskname}.json"
+def convert_root(root, with_personkeypoints, with_dummyobject_activity):
+    frame_sizes = {}
+    if root.find("image") is not None:
+        frame_sizes = _images_to_tracks(root)
+    problems, warnings = validate_root(root, with_personkeypoints, frame_sizes)
+    for warning in warnings:
+        print("Warning, %s" % warning)
+    if problems:
+        raise ValueError("%s problems in CVAT XML:\n%s" % (len(problems), "\n".join(problems)))
+    meta = root.find("meta")
+    taskname, date_str, start_frame, stop_frame = parse_meta(meta)
 
     # A collection of “info”, “annotations”, “categories”
     coco_dict = {
@@ -67,75 +90,237 @@ def convert(cvat_xml, coco_json_file, with_personkeypoints, with_dummyobject_act
     cat_name2id = _add_categories(meta, coco_dict)
 
     annot_id = 1
-    person_ids = _retrieve_person_ids(with_personkeypoints, with_dummyobject_activity, root, stop_frame)
+    index = _index_tracks(root)
+    person_ids = _retrieve_person_ids(with_personkeypoints, with_dummyobject_activity, index, stop_frame)
 
     # Loop through XML according to person ID (ID indicates shapes belonging to a specific unique person)
     print("Loop through XML according to ID")
     for person_id in person_ids:
-        start_frame_per_person, stop_frame_per_person = _retrieve_start_and_stop_frame_per_person_id(with_personkeypoints, with_dummyobject_activity, root, stop_frame, person_id)
-        if stop_frame_per_person == 0:
+        start_frame_per_person, stop_frame_per_person = _retrieve_start_and_stop_frame_per_person_id(with_personkeypoints, with_dummyobject_activity, index, stop_frame, person_id)
+        # no person box for this ID
+        if stop_frame_per_person < 0:
             continue
         print("Person track %s for start frame %s to end frame %s" % (person_id, start_frame_per_person, stop_frame_per_person))
+        person_frames = _index_person_frames(index, person_id, with_personkeypoints, with_dummyobject_activity)
         for frame_index in range(start_frame_per_person, stop_frame_per_person+1):
+            # no person box in this frame
+            box_elems = person_frames["boxes"].get(frame_index)
+            if not box_elems:
+                continue
             key_points = []
             if with_personkeypoints:
-                _convert_personkeypoints(root, person_id, frame_index, key_points)
+                _convert_personkeypoints(person_frames, frame_index, key_points)
 
             # Convert bbox person
-            for track_elem in root.findall("track"):
-                # group ID different => not the person to convert in this loop
-                if (with_personkeypoints or with_dummyobject_activity) and ('group_id' in track_elem.attrib) and int(track_elem.attrib["group_id"]) != person_id:
-                    continue
-                # group ID can be zero for the first person
-                if (with_personkeypoints or with_dummyobject_activity) and not ('group_id' in track_elem.attrib) and 0 != person_id:
+            for box_elem in box_elems:
+                if bool(int(box_elem.attrib["outside"])):
                     continue
-                # when the xml contains only bboxes no group ids are provided
-                if not (with_personkeypoints or with_dummyobject_activity) and  int(track_elem.attrib["id"]) != person_id:
-                    continue
-                for box_elem in track_elem.findall("box"):
-                    label_elem = track_elem.attrib["label"]
-                    label_name = str(label_elem)
-                    if label_name != "person":
-                        continue
-                    #  if frame ID different => not the bbox to convert in this loop
-                    if int(box_elem.attrib["frame"]) != frame_index:
-                        continue
-                    if bool(int(box_elem.attrib["outside"])):
-                        continue
-                    occluded = int(box_elem.attrib["occluded"])
-                    # [x,y,width,height], → Denoting the bbox location of that person. Box coordinates are measured from the top left image corner and are 0-indexed<br />
-                    x = float(box_elem.attrib["xtl"])
-                    y = float(box_elem.attrib["ytl"])
-                    r = float(box_elem.attrib["xbr"])
-                    b = float(box_elem.attrib["ybr"])
-                    w = r - x
-                    h = b - y
-                    # The person's actions which are captured
-                    actions = []
-                    _convert_actions(root, frame_index, person_id, box_elem, actions, with_dummyobject_activity)
-                    annot_dict = {
-                        "id": annot_id,
-                        "frame_id": frame_index,
-                        "category_id": 1,
-                        "keypoints": key_points,
-                        "bbox": [x, y, round(w, 3), round(h, 3)],
-                        "track_id": person_id,
-                        "occluded": occluded,
-                        "activity": actions
-                    }
-                    annot_id += 1
-                    coco_dict["annotations"].append(annot_dict)
+                occluded = int(box_elem.attrib["occluded"])
+                # [x,y,width,height], → Denoting the bbox location of that person. Box coordinates are measured from the top left image corner and are 0-indexed<br />
+                x = float(box_elem.attrib["xtl"])
+                y = float(box_elem.attrib["ytl"])
+                r = float(box_elem.attrib["xbr"])
+                b = float(box_elem.attrib["ybr"])
+                w = r - x
+                h = b - y
+                # The person's actions which are captured
+                actions = []
+                _convert_actions(person_frames, frame_index, box_elem, actions, with_dummyobject_activity)
+                annot_dict = {
+                    "id": annot_id,
+                    "frame_id": frame_index,
+                    "category_id": 1,
+                    "keypoints": key_points,
+                    "bbox": [x, y, round(w, 3), round(h, 3)],
+                    "track_id": person_id,
+                    "occluded": occluded,
+                    "activity": actions
+                }
+                annot_id += 1
+                coco_dict["annotations"].append(annot_dict)
 
     # Convert other bboxes, index starting from the already converted person tracks
     # generate new track_id
     coco_track_id = 1
     while coco_track_id in person_ids:
         coco_track_id +=1
-    for track_elem in root.findall("track"):
-        for frame_index in range(start_frame, stop_frame):
-            _convert_other_bboxes(coco_dict, annot_id, track_elem, coco_track_id, frame_index, cat_name2id)
+    for track_elem in index["tracks"]:
+        boxes_by_frame = _boxes_by_frame([track_elem])
+        for frame_index in sorted(boxes_by_frame):
+            if start_frame <= frame_index < stop_frame:
+                _convert_other_bboxes(coco_dict, annot_id, track_elem, boxes_by_frame[frame_index], coco_track_id, cat_name2id)
         annot_id += 1
-    _write_json(coco_json_file, coco_dict)
+    return coco_dict
+
+def _index_tracks(root):
+    # One pass over the tracks, the converter looks them up by person instead of walking the tree per person and frame.
+    # by_group: group_id, 0 for the tracks without one (the first person), grouped: only the tracks with a group_id,
+    # by_id: track id for the XML with only bboxes. The lists keep the order of the XML
+    index = {"tracks": root.findall("track"), "by_group": {}, "grouped": {}, "ungrouped": [], "by_id": {}}
+    for track_elem in index["tracks"]:
+        if "group_id" in track_elem.attrib:
+            group_id = int(track_elem.attrib["group_id"])
+            index["grouped"].setdefault(group_id, []).append(track_elem)
+        else:
+            group_id = 0
+            index["ungrouped"].append(track_elem)
+        index["by_group"].setdefault(group_id, []).append(track_elem)
+        if "id" in track_elem.attrib:
+            index["by_id"].setdefault(int(track_elem.attrib["id"]), []).append(track_elem)
+    return index
+
+def _index_person_frames(index, person_id, with_personkeypoints, with_dummyobject_activity):
+    # The shapes of one person per frame: person boxes, key points per label, the skeleton track and the activity points
+    if with_personkeypoints or with_dummyobject_activity:
+        tracks = index["by_group"].get(person_id, [])
+    else:
+        # when the xml contains only bboxes no group ids are provided
+        tracks = index["by_id"].get(person_id, [])
+    person_frames = {
+        "boxes": _boxes_by_frame([track_elem for track_elem in tracks if track_elem.attrib["label"] == "person"]),
+        "points": {},
+        "skeleton": None,
+        "actions": {}
+    }
+    if with_personkeypoints:
+        for track_elem in tracks:
+            label = track_elem.attrib["label"]
+            if label in KEY_POINTS_PERSON_LABELS:
+                for point_elem in track_elem.findall("points"):
+                    person_frames["points"].setdefault((label, int(point_elem.attrib["frame"])), []).append(point_elem)
+            # One skeleton track holds all person key points of a frame, only the first one is used
+            elif label == KEY_POINTS_SKELETON_LABEL and person_frames["skeleton"] is None:
+                person_frames["skeleton"] = {}
+                for skeleton_elem in track_elem.findall("skeleton"):
+                    person_frames["skeleton"].setdefault(int(skeleton_elem.attrib["frame"]), []).append(skeleton_elem)
+    if with_dummyobject_activity:
+        for track_elem in index["grouped"].get(person_id, []):
+            for points_elem in track_elem.findall("points"):
+                person_frames["actions"].setdefault(int(points_elem.attrib["frame"]), []).append(points_elem)
+    return person_frames
+
+def _boxes_by_frame(tracks):
+    boxes_by_frame = {}
+    for track_elem in tracks:
+        for box_elem in track_elem.findall("box"):
+            boxes_by_frame.setdefault(int(box_elem.attrib["frame"]), []).append(box_elem)
+    return boxes_by_frame
+
+def _images_to_tracks(root):
+    # An image mode dump holds the shapes per frame. Regroup them in tracks per label and group ID, as in a track mode dump.
+    # CVAT leaves group_id out (or 0) for ungrouped shapes, nothing links them across frames so each gets its own track
+    tracks = {}
+    track_id = 0
+    # frame -> (width, height) from the <image> attributes
+    frame_sizes = {}
+    for image_elem in root.findall("image"):
+        frame = image_elem.attrib["id"]
+        if "width" in image_elem.attrib and "height" in image_elem.attrib:
+            frame_sizes[int(frame)] = (float(image_elem.attrib["width"]), float(image_elem.attrib["height"]))
+        for shape_elem in list(image_elem):
+            label = shape_elem.attrib.pop("label")
+            group_id = shape_elem.attrib.pop("group_id", None)
+            if group_id == "0":
+                group_id = None
+            track_elem = tracks.get((label, group_id)) if group_id is not None else None
+            if track_elem is None:
+                track_attrib = {"id": str(track_id), "label": label}
+                if group_id is not None:
+                    track_attrib["group_id"] = group_id
+                track_elem = root.makeelement("track", track_attrib)
+                root.append(track_elem)
+                track_id += 1
+                if group_id is not None:
+                    tracks[(label, group_id)] = track_elem
+            shape_elem.set("frame", frame)
+            shape_elem.set("outside", shape_elem.attrib.get("outside", "0"))
+            shape_elem.set("keyframe", shape_elem.attrib.get("keyframe", "1"))
+            track_elem.append(shape_elem)
+        root.remove(image_elem)
+    return frame_sizes
+
+def validate_root(root, with_personkeypoints, frame_sizes=None):
+    # Gather the shapes in columns once, then check all of them with array operations.
+    # Returns the problems that stop the conversion and the warnings (boxes outside the image)
+    default_size = _original_size(root.find("meta"))
+    frame_sizes = frame_sizes or {}
+    box_locations, box_keys, box_coords, box_outside, box_sizes = [], [], [], [], []
+    point_locations, point_keys, point_coords = [], [], []
+    for track_elem in root.findall("track"):
+        track_id = track_elem.attrib.get("id")
+        label = track_elem.attrib.get("label")
+        group_id = int(track_elem.attrib.get("group_id", 0))
+        for box_elem in track_elem.findall("box"):
+            # the attributes are read once, every .attrib is a new object with lxml
+            box_attrib = box_elem.attrib
+            frame = int(box_attrib["frame"])
+            box_locations.append((track_id, label, box_attrib["frame"]))
+            box_keys.append((int(track_id), frame))
+            box_coords.append([float(box_attrib[k]) for k in ("xtl", "ytl", "xbr", "ybr")])
+            box_outside.append(bool(int(box_attrib.get("outside", 0))))
+            box_sizes.append(frame_sizes.get(frame, default_size))
+        if not with_personkeypoints:
+            continue
+        # (group, key point, frame) of the per key point tracks and of the skeleton points
+        if label in KEY_POINTS_PERSON_LABELS:
+            point_index = KEY_POINTS_PERSON_LABELS.index(label)
+            for point_elem in track_elem.findall("points"):
+                point_attrib = point_elem.attrib
+                point_locations.append((track_id, label, point_attrib["frame"]))
+                point_keys.append((group_id, point_index, int(point_attrib["frame"])))
+                point_coords.append(len(point_attrib["points"].split(",")))
+        if label == KEY_POINTS_SKELETON_LABEL:
+            for skeleton_elem in track_elem.findall("skeleton"):
+                frame = skeleton_elem.attrib["frame"]
+                for point_elem in skeleton_elem.findall("points"):
+                    point_attrib = point_elem.attrib
+                    point_label = point_attrib.get("label")
+                    point_locations.append((track_id, point_label, frame))
+                    point_index = KEY_POINTS_PERSON_LABELS.index(point_label) if point_label in KEY_POINTS_PERSON_LABELS else -1
+                    point_keys.append((group_id, point_index, int(frame)))
+                    point_coords.append(len(point_attrib["points"].split(",")))
+    box_keys = np.asarray(box_keys, dtype=int).reshape(-1, 2)
+    box_coords = np.asarray(box_coords, dtype=float).reshape(-1, 4)
+    box_outside = np.asarray(box_outside, dtype=bool)
+    box_sizes = np.asarray(box_sizes, dtype=float).reshape(-1, 2)
+    point_keys = np.asarray(point_keys, dtype=int).reshape(-1, 3)
+    point_coords = np.asarray(point_coords, dtype=int)
+
+    problems = []
+    warnings = []
+
+    def report(locations, mask, message, found=problems):
+        for idx in np.flatnonzero(mask):
+            found.append("track %s label %s frame %s: %s" % (*locations[idx], message))
+
+    # outside boxes are not converted, their coordinates don't matter
+    inside = ~box_outside
+    report(box_locations, _duplicate_rows(box_keys), "duplicate box in track and frame")
+    report(box_locations, inside & ((box_coords[:, 2] <= box_coords[:, 0]) | (box_coords[:, 3] <= box_coords[:, 1])), "box width or height not positive")
+    report(box_locations, inside & ((box_coords[:, 0] < 0) | (box_coords[:, 1] < 0) | (box_coords[:, 2] > box_sizes[:, 0]) | (box_coords[:, 3] > box_sizes[:, 1])),
+           "box outside the image", warnings)
+    report(point_locations, point_keys[:, 1] < 0, "unknown key point label")
+    report(point_locations, point_coords != 2, "key point is not x,y")
+    report(point_locations, _duplicate_rows(point_keys) & (point_keys[:, 1] >= 0), "duplicate key point for person and frame")
+    return problems, warnings
+
+def _original_size(meta):
+    # (width, height) of the frames from meta/task/original_size, unbounded when not provided
+    if meta is not None:
+        task = meta.find("task")
+        if task is None:
+            task = meta.find("job")
+        size_el = task.find("original_size") if task is not None else None
+        if size_el is not None and size_el.find("width") is not None and size_el.find("height") is not None:
+            return float(size_el.find("width").text), float(size_el.find("height").text)
+    return np.inf, np.inf
+
+def _duplicate_rows(keys):
+    # True for the rows equal to an earlier row
+    duplicate = np.ones(len(keys), dtype=bool)
+    _, first = np.unique(keys, axis=0, return_index=True)
+    duplicate[first] = False
+    return duplicate
 
 def _add_categories(meta, coco_dict):
     # The “categories” object contains a list of categories (e.g. dog, boat) and each of those belongs to a supercategory (e.g. animal, vehicle).
@@ -162,7 +347,7 @@ def _add_categories(meta, coco_dict):
             label_name = label_el.find("name").text
             if label_name == "person":
                 continue
-            if label_name in KEY_POINTS_PERSON_LABELS:
+            if label_name in KEY_POINTS_PERSON_LABELS or label_name == KEY_POINTS_SKELETON_LABEL:
                 continue
             cat_name2id[label_name] = cat_id
             cat_dict = {"id": cat_id, "name": label_name, "supercategory": ""}
@@ -170,24 +355,22 @@ def _add_categories(meta, coco_dict):
             coco_dict["categories"].append(cat_dict)
     return cat_name2id
 
-def _retrieve_person_ids(with_personkeypoints, with_dummyobject_activity, root, stop_frame):
+def _retrieve_person_ids(with_personkeypoints, with_dummyobject_activity, index, stop_frame):
     if with_personkeypoints or with_dummyobject_activity:
         person_ids = []
         # It could happen that the first person retrieved from the CVAT xml does not have a group_id. In that case add ID = 0
-        start_frame_per_person, stop_frame_per_person = _retrieve_start_and_stop_frame_per_person_id(with_personkeypoints, with_dummyobject_activity, root, stop_frame, 0)
-        if(stop_frame_per_person > 0):
+        start_frame_per_person, stop_frame_per_person = _retrieve_start_and_stop_frame_per_person_id(with_personkeypoints, with_dummyobject_activity, index, stop_frame, 0)
+        if(stop_frame_per_person >= 0):
             person_ids = [0]
-        for track_elem in root.findall("track"):
-            # All shapes (points, bboxes) from one person belong to one group. Add the group ID to the person ID list.
-            if ('group_id' in track_elem.attrib):
-                person_id = int(track_elem.attrib["group_id"])
-                if person_id not in person_ids:
-                    person_ids.append(person_id)
+        # All shapes (points, bboxes) from one person belong to one group. Add the group ID to the person ID list.
+        for person_id in index["grouped"]:
+            if person_id not in person_ids:
+                person_ids.append(person_id)
 
     # If no groups are set (in case of only person bboxes in XML), use track ID XML
     else:
         person_ids = []
-        for track_elem in root.findall("track"):
+        for track_elem in index["tracks"]:
             if ('id' in track_elem.attrib):
                 person_id = int(track_elem.attrib["id"])
                 label = str(track_elem.attrib["label"])
@@ -195,16 +378,18 @@ def _retrieve_person_ids(with_personkeypoints, with_dummyobject_activity, root,
                     person_ids.append(person_id)
     return person_ids
 
-def _retrieve_start_and_stop_frame_per_person_id(with_personkeypoints, with_dummyobject_activity, root, stop_frame, person_id):
+def _retrieve_start_and_stop_frame_per_person_id(with_personkeypoints, with_dummyobject_activity, index, stop_frame, person_id):
     start_frame_per_person = stop_frame
-    stop_frame_per_person = 0
-    for track_elem in root.findall("track"):
+    # -1 when no box is found, a person can be annotated in frame 0 only
+    stop_frame_per_person = -1
+    if with_personkeypoints or with_dummyobject_activity:
+        # the tracks without group_id count for every person
+        tracks = index["grouped"].get(person_id, []) + index["ungrouped"]
+    else:
+        tracks = index["by_id"].get(person_id, [])
+    for track_elem in tracks:
         if track_elem.attrib["label"] != "person":
             continue
-        if (with_personkeypoints or with_dummyobject_activity) and ('group_id' in track_elem.attrib) and int(track_elem.attrib["group_id"]) != person_id:
-            continue
-        if not (with_personkeypoints or with_dummyobject_activity) and int(track_elem.attrib["id"]) != person_id:
-             continue
         for box_elem in track_elem.findall("box"):
             frame_index = int(box_elem.attrib["frame"])
             if frame_index < start_frame_per_person:
@@ -213,26 +398,21 @@ def _retrieve_start_and_stop_frame_per_person_id(with_personkeypoints, with_dumm
                 stop_frame_per_person = frame_index
     return start_frame_per_person,stop_frame_per_person
 
-def _convert_actions(root, frame_index, person_id, box_elem, actions, with_dummyobject_activity):
+def _convert_actions(person_frames, frame_index, box_elem, actions, with_dummyobject_activity):
     if with_dummyobject_activity:
-        for track_elem2 in root.findall("track"):
-            if ("group_id" not in track_elem2.attrib or int(track_elem2.attrib["group_id"]) != person_id):
+        for points_elem in person_frames["actions"].get(frame_index, []):
+            if bool(int(points_elem.attrib["outside"])):
                 continue
-            for points_elem in track_elem2.findall("points"):
-                if int(points_elem.attrib["frame"]) != frame_index:
-                    continue
-                if bool(int(points_elem.attrib["outside"])):
-                    continue
-                #checkbox
-                for attr_elem in points_elem.findall("attribute"):
-                    if attr_elem.text is not None and str(attr_elem.text.lower()) == "true":
-                        actions.append(attr_elem.attrib["name"])
-                #list
-                for attr_elem in points_elem.findall("attribute"):
-                    if attr_elem.text is not None:
-                        if (attr_elem.attrib["name"] == "activity"):
-                            if str(attr_elem.text.lower()) != "no action":
-                                actions.append(str(attr_elem.text))
+            #checkbox
+            for attr_elem in points_elem.findall("attribute"):
+                if attr_elem.text is not None and str(attr_elem.text.lower()) == "true":
+                    actions.append(attr_elem.attrib["name"])
+            #list
+            for attr_elem in points_elem.findall("attribute"):
+                if attr_elem.text is not None:
+                    if (attr_elem.attrib["name"] == "activity"):
+                        if str(attr_elem.text.lower()) != "no action":
+                            actions.append(str(attr_elem.text))
     else:
          #checkbox
         for attr_elem in box_elem.findall("attribute"):
@@ -245,68 +425,68 @@ def _convert_actions(root, frame_index, person_id, box_elem, actions, with_dummy
                     if str(attr_elem.text.lower()) != "no action":
                         actions.append(str(attr_elem.text))
 
-def _convert_personkeypoints(root, person_id, frame_index, key_points):
+def _convert_personkeypoints(person_frames, frame_index, key_points):
+    # One skeleton track holds all person key points of a frame
+    if person_frames["skeleton"] is not None:
+        _convert_skeleton_keypoints(person_frames["skeleton"].get(frame_index, []), key_points)
+        return
     # Iterate over all person key points
-    for person_label_idx in range(len(KEY_POINTS_PERSON_LABELS)):
-        is_point_available = False
-        for track_elem in root.findall("track"):
-            # if group ID different => not the person to convert in this loop
-            if ('group_id' in track_elem.attrib) and int(track_elem.attrib["group_id"]) != person_id:
-                continue
-            # It could happen that the first person retrieved from the CVAT xml does not have a group_id. In that case ID = 0
-            if (not ('group_id' in track_elem.attrib)) and 0 != person_id:
-                continue
-            # if person label different => not the person key point to convert in this loop
-            if KEY_POINTS_PERSON_LABELS[person_label_idx] != track_elem.attrib["label"]:
-                continue
-            for point_elem in track_elem.findall("points"):
-                #  if frame ID different => not the point to convert in this loop
-                point_frame_id = int(point_elem.attrib["frame"])
-                if int(point_frame_id) != frame_index:
-                    continue
-                # Indicates visibility— 0: outside, 1: labeled but not visible, and 2: labeled and visible
-                if bool(int(point_elem.attrib["outside"])):
-                    visibil = 0
-                elif bool(int(point_elem.attrib["occluded"])):
-                    visibil = 1
-                else:
-                    # The face key points are set to 1 (face blurring)
-                    if track_elem.attrib["label"] in KEY_POINTS_FACE_LABELS:
-                        visibil = 1
-                    else:
-                        visibil = 2
-                # [x1,y1,v1,x2,y2,v2...], → x and y indicate pixel positions in the image
-                points = point_elem.attrib["points"]
-                pos_arr = points.split(',')
-                key_point = []
-                for pos in pos_arr:
-                    if visibil == 0:
-                        key_point.append(float(0))
-                    else:
-                        key_point.append(float(pos))
-                key_point.append(visibil)
-                key_points.extend(key_point)
-                is_point_available = True
-                # if no point from xml
-        if not is_point_available:
-            key_point = []
-            key_point.append(float(0))
-            key_point.append(float(0))
-            key_point.append(0)
-            key_points.extend(key_point)
-            is_point_available = True
+    for label in KEY_POINTS_PERSON_LABELS:
+        point_elems = person_frames["points"].get((label, frame_index))
+        # if no point from xml
+        if not point_elems:
+            key_points.extend([float(0), float(0), 0])
+            continue
+        for point_elem in point_elems:
+            key_points.extend(_convert_point(point_elem, label))
 
-    assert len(key_points) == 51, "Error length keypoints %s" %len(key_points)
+def _convert_skeleton_keypoints(skeleton_elems, key_points):
+    # skeleton_elems: the skeletons of the person in this frame
+    points_by_label = {}
+    for skeleton_elem in skeleton_elems:
+        if bool(int(skeleton_elem.attrib.get("outside", 0))):
+            break
+        for point_elem in skeleton_elem.findall("points"):
+            points_by_label[point_elem.attrib["label"]] = point_elem
+    for label in KEY_POINTS_PERSON_LABELS:
+        # if no point from xml
+        if label not in points_by_label:
+            key_points.extend([float(0), float(0), 0])
+            continue
+        key_points.extend(_convert_point(points_by_label[label], label))
 
-def _convert_other_bboxes(coco_dict, annot_id, track_elem, track_id, frame_index, cat_name2id):
-    for box_elem in track_elem.findall("box"):
+def _convert_point(point_elem, label):
+    # Indicates visibility— 0: outside, 1: labeled but not visible, and 2: labeled and visible
+    point_attrib = point_elem.attrib
+    if bool(int(point_attrib["outside"])):
+        visibil = 0
+    elif bool(int(point_attrib["occluded"])):
+        visibil = 1
+    else:
+        # The face key points are set to 1 (face blurring)
+        if label in KEY_POINTS_FACE_LABELS:
+            visibil = 1
+        else:
+            visibil = 2
+    # [x1,y1,v1,x2,y2,v2...], → x and y indicate pixel positions in the image
+    points = point_attrib["points"]
+    pos_arr = points.split(',')
+    key_point = []
+    for pos in pos_arr:
+        if visibil == 0:
+            key_point.append(float(0))
+        else:
+            key_point.append(float(pos))
+    key_point.append(visibil)
+    return key_point
+
+def _convert_other_bboxes(coco_dict, annot_id, track_elem, box_elems, track_id, cat_name2id):
+    # box_elems: the boxes of the track in one frame
+    for box_elem in box_elems:
         label_elem = track_elem.attrib["label"]
         label_name = str(label_elem)
         if label_name == "person":
             continue
-        #  if frame ID different => not the bbox to convert in this loop
-        if int(box_elem.attrib["frame"]) != frame_index:
-            continue
         if bool(int(box_elem.attrib["outside"])):
             continue
         frame_idx = int(box_elem.attrib["frame"])
@@ -346,12 +526,27 @@ def parse_args():
                     help="Use this flag when person key points are included")
     parser.add_argument("--with-dummyobject-activity", default=False, action="store_true",
                     help="Flag to use dummy object activity")
+    parser.add_argument("--output-format", default="json", choices=OUTPUT_FORMATS,
+                    help="json (indented), compact or ndjson (one annotation per line and a .header.json file)")
+    parser.add_argument("--shard-size", type=int, default=0,
+                    help="Split the annotations in shards of about this many annotations, the output file becomes the manifest")
+    parser.add_argument("--shard-by", default="frames", choices=SHARD_BY,
+                    help="Keep frames or tracks together in a shard")
+    parser.add_argument("--shard-workers", type=int, default=4,
+                    help="Number of worker processes writing the shards, 1 writes them in this process")
+    parser.add_argument("--pipelined", default=False, action='store_true',
+                    help="Read and write the files in background threads, overlapping I/O with the conversion")
+    parser.add_argument("--npy-dir", metavar='DIR', default=None,
+                    help="Also write the person key points, bboxes and activities as dense .npy arrays in this directory")
+    parser.add_argument("--xml-backend", default="etree", choices=XML_BACKENDS,
+                    help="XML parser, etree (standard library) or lxml (must be installed)")
 
     return parser.parse_args()
 
 def main():
     args = parse_args()
-    convert(args.cvat_xml, args.coco_json, args.with_personkeypoints, args.with_dummyobject_activity)
+    convert(args.cvat_xml, args.coco_json, args.with_personkeypoints, args.with_dummyobject_activity, args.output_format,
+            args.shard_size, args.shard_by, args.shard_workers, args.pipelined, args.npy_dir, args.xml_backend)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
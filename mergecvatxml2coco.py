@@ -0,0 +1,109 @@
+'''
+@Created Date 19 Oct 2026
+@Copyright (c) 2022, AUTIMATIC
+
+Merge person skeletons from many CVAT XML into one COCO JSON
+'''
+
+import argparse
+
+from cocoio import OUTPUT_FORMATS, CocoStreamWriter
+from cvatxml2coco import convert_root, parse_meta, _add_categories
+from pipeline import open_file
+from xmlbackend import XML_BACKENDS, get_backend
+
+def merge(cvat_xmls, coco_json_file, with_personkeypoints, with_dummyobject_activity, output_format="json", pipelined=False, xml_backend="etree"):
+    backend = get_backend(xml_backend)
+    # First pass: only the <meta> block of every input, to build the combined categories
+    merged_dict = {"categories": []}
+    merged_name2id = _add_categories(None, merged_dict)
+    cat_id_maps = []
+    stop_frames = []
+    date_str = None
+    for cvat_xml in cvat_xmls:
+        meta = _read_meta(cvat_xml, backend)
+        _, dumped_str, _, stop_frame = parse_meta(meta)
+        stop_frames.append(stop_frame)
+        date_str = max(date_str or dumped_str, dumped_str)
+        input_dict = {"categories": []}
+        cat_name2id = _add_categories(meta, input_dict)
+        for cat_dict in input_dict["categories"]:
+            if cat_dict["name"] not in merged_name2id:
+                merged_name2id[cat_dict["name"]] = len(merged_dict["categories"]) + 1
+                merged_dict["categories"].append(dict(cat_dict, id=merged_name2id[cat_dict["name"]]))
+        # input category ID -> merged category ID
+        cat_id_maps.append({cat_id: merged_name2id[name] for name, cat_id in cat_name2id.items()})
+
+    header = {
+        "info": {"description": "merged from %s tasks" % len(cvat_xmls), "data_created": date_str},
+        "categories": merged_dict["categories"]
+    }
+    writer = CocoStreamWriter(coco_json_file, header, output_format, pipelined)
+    try:
+        # Second pass: convert the inputs one at a time, the annotation IDs, track IDs and frames are shifted to not collide
+        annot_id = 1
+        track_offset = 0
+        frame_offset = 0
+        for cvat_xml, cat_id_map, stop_frame in zip(cvat_xmls, cat_id_maps, stop_frames):
+            print(f"Parse XML {cvat_xml} with {backend.name}, track offset {track_offset}, frame offset {frame_offset}")
+            with open_file(cvat_xml, "rb", pipelined) as f:
+                root = backend.parse(f)
+            coco_dict = convert_root(root, with_personkeypoints, with_dummyobject_activity)
+            del root
+            max_track_id = -1
+            max_frame_id = stop_frame
+            for annot_dict in coco_dict["annotations"]:
+                max_track_id = max(max_track_id, annot_dict["track_id"])
+                max_frame_id = max(max_frame_id, annot_dict["frame_id"])
+                annot_dict["id"] = annot_id
+                annot_dict["category_id"] = cat_id_map[annot_dict["category_id"]]
+                annot_dict["track_id"] += track_offset
+                annot_dict["frame_id"] += frame_offset
+                writer.add_annotation(annot_dict)
+                annot_id += 1
+            track_offset += max_track_id + 1
+            frame_offset += max_frame_id + 1
+    except BaseException:
+        # no truncated output when an input fails to convert
+        writer.discard()
+        raise
+    writer.close()
+
+def _read_meta(cvat_xml, backend):
+    # <meta> is the first block of a CVAT XML, stop parsing once it is closed
+    for elem in backend.iterparse(cvat_xml, "meta"):
+        return elem
+    return None
+
+def parse_args():
+    """Parse arguments of command line"""
+    parser = argparse.ArgumentParser(
+        description='Merge CVAT XML files to one COCO JSON'
+    )
+    parser.add_argument(
+        '--cvat-xml', metavar='FILE', required=True, nargs='+',
+        help='Input files with CVAT annotations in XML format'
+    )
+    parser.add_argument(
+        '--coco-json', metavar='FILE', required=True,
+        help='File for output annotations in JSON format'
+    )
+    parser.add_argument("--with-personkeypoints", default=False, action='store_true',
+                    help="Use this flag when person key points are included")
+    parser.add_argument("--with-dummyobject-activity", default=False, action="store_true",
+                    help="Flag to use dummy object activity")
+    parser.add_argument("--output-format", default="json", choices=OUTPUT_FORMATS,
+                    help="json (indented), compact or ndjson (one annotation per line and a .header.json file)")
+    parser.add_argument("--pipelined", default=False, action='store_true',
+                    help="Read and write the files in background threads, overlapping I/O with the conversion")
+    parser.add_argument("--xml-backend", default="etree", choices=XML_BACKENDS,
+                    help="XML parser, etree (standard library) or lxml (must be installed)")
+
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    merge(args.cvat_xml, args.coco_json, args.with_personkeypoints, args.with_dummyobject_activity, args.output_format, args.pipelined, args.xml_backend)
+
+if __name__ == '__main__':
+    main()
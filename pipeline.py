@@ -0,0 +1,124 @@
+'''
+@Created Date 19 Oct 2026
+@Copyright (c) 2022, AUTIMATIC
+
+Read and write files in background threads, so disk I/O overlaps the conversion
+'''
+
+import io
+import queue
+import threading
+
+CHUNK_SIZE = 1 << 20
+# Two chunks in flight (double buffering): the thread reads or writes one while the converter uses the other.
+# A full queue blocks the producer (back-pressure)
+QUEUE_DEPTH = 2
+
+def open_file(path, mode="r", pipelined=False, chunk_size=CHUNK_SIZE, depth=QUEUE_DEPTH):
+    if not pipelined:
+        return open(path, mode)
+    if mode in ("r", "rb"):
+        buffered = io.BufferedReader(_ReaderRaw(path, chunk_size, depth), chunk_size)
+    elif mode in ("w", "wb"):
+        buffered = io.BufferedWriter(_WriterRaw(path, depth), chunk_size)
+    else:
+        raise ValueError("Unsupported mode %s" % mode)
+    if "b" in mode:
+        return buffered
+    return io.TextIOWrapper(buffered, encoding="utf-8")
+
+class _ReaderRaw(io.RawIOBase):
+    # A reader thread feeds raw chunks of the file through a bounded queue
+    def __init__(self, path, chunk_size, depth):
+        self._file = open(path, "rb")
+        self._queue = queue.Queue(maxsize=depth)
+        self._chunk = b""
+        self._pos = 0
+        self._eof = False
+        self._stop = False
+        self._error = None
+        self._thread = threading.Thread(target=self._run, args=(chunk_size,), daemon=True)
+        self._thread.start()
+
+    def _run(self, chunk_size):
+        try:
+            while not self._stop:
+                chunk = self._file.read(chunk_size)
+                self._queue.put(chunk)
+                if not chunk:
+                    return
+        except BaseException as e:
+            self._error = e
+            self._queue.put(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._pos >= len(self._chunk):
+            if self._eof:
+                return 0
+            self._chunk = self._queue.get()
+            self._pos = 0
+            if not self._chunk:
+                self._eof = True
+                if self._error is not None:
+                    raise self._error
+                return 0
+        n = min(len(b), len(self._chunk) - self._pos)
+        b[:n] = self._chunk[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        if self.closed:
+            return
+        # The reader thread can be blocked on a full queue when the file was not read to the end
+        self._stop = True
+        while self._thread.is_alive():
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                self._thread.join(0.01)
+        self._file.close()
+        super().close()
+
+class _WriterRaw(io.RawIOBase):
+    # A writer thread drains the rendered chunks from a bounded queue into the file
+    def __init__(self, path, depth):
+        self._file = open(path, "wb")
+        self._queue = queue.Queue(maxsize=depth)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            # after an error keep draining, so the converter never blocks
+            if self._error is None:
+                try:
+                    self._file.write(chunk)
+                except BaseException as e:
+                    self._error = e
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(bytes(b))
+        return len(b)
+
+    def close(self):
+        if self.closed:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+        super().close()
+        if self._error is not None:
+            raise self._error
@@ -7,18 +7,20 @@ Convert TXT with bounding boxes to COCO JSON
 '''
 
 
-import json
 from datetime import datetime, date
 import argparse
 
-def convert(input_txt_file, output_json_file):
+from cocoio import OUTPUT_FORMATS, SHARD_BY, write_coco_json, write_coco_shards
+from pipeline import open_file
+
+def convert(input_txt_file, output_json_file, output_format="json", shard_size=0, shard_by="frames", shard_workers=4, pipelined=False):
     coco_dict = {}
     date_str = f"{date.today():%Y/%m/%d}"
     coco_dict['info'] = {"description": "extracted from %s" %input_txt_file, "data_created": date_str}
     coco_dict['categories'] = [{"id": 1, "name": "person", "supercategory": ""}]
     coco_dict['annotations'] = []
     
-    with open(input_txt_file, "r") as filestream:
+    with open_file(input_txt_file, "r", pipelined) as filestream:
         annotation_id = 0
         for line in filestream:
             currentline = line.split(",")
@@ -33,9 +35,10 @@ def convert(input_txt_file, output_json_file):
             coco_dict['annotations'].append(dict_obj)
             annotation_id += 1
 
-    with open(output_json_file, "w") as fobj:
-        json.dump(coco_dict, fobj, indent=2)
-        print(f"Wrote json to {output_json_file}")
+    if shard_size > 0:
+        write_coco_shards(output_json_file, coco_dict, shard_size, shard_by, output_format, shard_workers, pipelined)
+    else:
+        write_coco_json(output_json_file, coco_dict, output_format, pipelined)
 
 
 def parse_args():
@@ -51,11 +54,21 @@ def parse_args():
         '--output-json-file', metavar='FILE', required=True,
         help='Output JSON file'
     )
+    parser.add_argument("--output-format", default="json", choices=OUTPUT_FORMATS,
+                    help="json (indented), compact or ndjson (one annotation per line and a .header.json file)")
+    parser.add_argument("--shard-size", type=int, default=0,
+                    help="Split the annotations in shards of about this many annotations, the output file becomes the manifest")
+    parser.add_argument("--shard-by", default="frames", choices=SHARD_BY,
+                    help="Keep frames or tracks together in a shard")
+    parser.add_argument("--shard-workers", type=int, default=4,
+                    help="Number of worker processes writing the shards, 1 writes them in this process")
+    parser.add_argument("--pipelined", default=False, action='store_true',
+                    help="Read and write the files in background threads, overlapping I/O with the conversion")
     return parser.parse_args()
 
 def main(): 
     args = parse_args()
-    convert(args.input_txt_file, args.output_json_file)
+    convert(args.input_txt_file, args.output_json_file, args.output_format, args.shard_size, args.shard_by, args.shard_workers, args.pipelined)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,55 @@
+'''
+@Created Date 19 Oct 2026
+@Copyright (c) 2022, AUTIMATIC
+
+XML parser backends for CVAT XML. The parsed elements follow the ElementTree API (find, findall, attrib, text),
+so the converters work the same with every backend
+'''
+
+import xml.etree.ElementTree as ET
+
+# etree: the standard library, lxml: optional, parses faster but every element and attribute access
+# is slower, the whole conversion takes about as long (measured with benchmark_xml_backends.py)
+XML_BACKENDS = ["etree", "lxml"]
+
+class EtreeBackend:
+    name = "etree"
+
+    def parse(self, source):
+        return ET.parse(source).getroot()
+
+    def iterparse(self, source, tag):
+        # Yields the elements with this tag once they are closed
+        for _, elem in ET.iterparse(source, events=("end",)):
+            if elem.tag == tag:
+                yield elem
+
+class LxmlBackend:
+    name = "lxml"
+
+    def __init__(self):
+        from lxml import etree
+        self._etree = etree
+        self._parser = etree.XMLParser(huge_tree=True)
+
+    def parse(self, source):
+        return self._etree.parse(source, self._parser).getroot()
+
+    def iterparse(self, source, tag):
+        # The tag filter is applied by the C parser, other elements are not handed to Python
+        for _, elem in self._etree.iterparse(source, events=("end",), tag=tag, huge_tree=True):
+            yield elem
+
+def available_backends():
+    names = ["etree"]
+    try:
+        import lxml.etree
+        names.append("lxml")
+    except ImportError:
+        pass
+    return names
+
+def get_backend(name="etree"):
+    if name == "lxml":
+        return LxmlBackend()
+    return EtreeBackend()